@@ -1,14 +1,28 @@
-from flask import Flask, session, render_template, request, redirect, url_for
-import json
+from flask import Flask, Response, session, render_template, request, redirect, url_for
+from flask.json.provider import JSONProvider
+import orjson
 import os
 import secrets
 import string
 import shutil
-import base64
+import hashlib
+import threading
 import dfa
 import re as reg
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+class OrjsonProvider(JSONProvider):
+  # use orjson for all JSON handled by flask (request bodies, tojson filter in templates), it is a lot faster than the json module
+  def dumps(self, obj, **kwargs):
+    return orjson.dumps(obj).decode('utf-8')
+
+  def loads(self, s, **kwargs):
+    return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
   
 # Set secret key
 app.secret_key = 'MY_SECRET_KEY'
@@ -26,14 +40,92 @@ if not os.path.exists(UPLOAD_FOLDER):
 # Allowed file extension
 ALLOWED_EXTENSIONS = {'json'}
 
+# everything that is derived from a user's DFA encoding (cached per user and fingerprint of the encoding)
+# image is a future for the visualization of the entire DFA, which is rendered in the background while the rest is built (None if the session wasn't built for the page itself)
+Session = namedtuple('Session', ['dfa', 'total_regex', 'regex_table', 'step_table', 'tree_data', 'image'])
+# one cached session per user (for the most recently active ones), maps user id to (fingerprint of the encoding, session)
+SESSION_CACHE_SIZE = 128
+session_cache = OrderedDict()
+session_cache_lock = threading.Lock()
+# for rendering visualizations in the background (graphviz runs as a separate process, so this doesn't compete with the conversion for the GIL)
+executor = ThreadPoolExecutor(max_workers=4)
+
+def json_response(data):
+  # orjson already produces utf-8 encoded bytes, so pass them to the response as they are instead of decoding and encoding them again
+  return app.response_class(orjson.dumps(data), mimetype='application/json')
+
 def allowed_file(filename):
   return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def encoding_fingerprint(id):
+  # modification time and size of a user's DFA encoding, used as part of the cache key (changes whenever a new file is saved)
+  # a single stat call, so unchanged encodings are recognized without reading or parsing them
+  stat = os.stat('./' + UPLOAD_FOLDER + '/' + id + '/dfa_encoding.json')
+  return f'{stat.st_mtime_ns}-{stat.st_size}'
+
+def load_session(id, fingerprint, render=False):
+  # return the cached session of this user if their encoding did not change since it was built, otherwise build (and cache) it again
+  with session_cache_lock:
+    cached = session_cache.get(id)
+    if cached is not None and cached[0] == fingerprint:
+      session_cache.move_to_end(id)
+      return cached[1]
+  # building happens outside of the lock, so requests of other users don't have to wait for it
+  with open('./' + UPLOAD_FOLDER + '/' + id + '/dfa_encoding.json', 'rb') as f:
+    current = build_session(orjson.loads(f.read()), render)
+  cache_session(id, fingerprint, current)
+  return current
+
+def cache_session(id, fingerprint, current):
+  # remember the session built from the encoding of this user with the given fingerprint
+  with session_cache_lock:
+    # replaces the outdated entry of this user, if there is one
+    session_cache[id] = (fingerprint, current)
+    session_cache.move_to_end(id)
+    # evict the least recently used sessions
+    while len(session_cache) > SESSION_CACHE_SIZE:
+      session_cache.popitem(last=False)
+
+def build_session(json_data, render=False):
+  # build DFA from a parsed encoding and convert to regex (visualizations of single steps are only generated once the browser asks for them, see render_image)
+  # the DFA checks the encoding first, so invalid ones fail before any of the expensive work
+  current_dfa = dfa.DFA(json_data['states'], json_data['alphabet'], json_data['initial'], json_data['accept'], json_data['transitions'])
+  # if the session is built for the page, which always shows the entire DFA first, start rendering it right away while the conversion runs
+  image = executor.submit(lambda: current_dfa.visualize('current_visualization').pipe(format='svg')) if render else None
+  (total_regex, regex_table, step_table) = current_dfa.to_regex()
+  tree_data = build_tree(current_dfa.states, current_dfa.initial, current_dfa.accept)
+  return Session(current_dfa, total_regex, regex_table, step_table, tree_data, image)
+
+@lru_cache(maxsize=128)
+def render_image(id, fingerprint, k, i, j):
+  # generate the image for the entire DFA (k, i and j are None) or a single step a(k, i, j), cached the same way as the session it belongs to
+  current = load_session(id, fingerprint)
+  if k is None or i is None or j is None:
+    # use the render that was started when the session was built, unless there is none or it failed (its exception would be raised on every request)
+    if current.image is not None and current.image.exception() is None:
+      return current.image.result()
+    return current.dfa.visualize('current_visualization').pipe(format='svg')
+  visualized = current.dfa.visualize('current_visualization', current.step_table[k][i][j], i, j)
+  return visualized.pipe(format='svg')
   
+@lru_cache(maxsize=256)
+def compiled_regex(pattern):
+  # sanity checks usually test many inputs against the same regex, so only compile each one once
+  return reg.compile(pattern)
+  
+# format of the labels in the tree view, see ints_to_tree_label
+TREE_LABEL = reg.compile(r'a\((\d+), (\d+), (\d+)\)')
+
+# the 'OR' entries between both sides of a step are all the same, so they can share a single node (it is only ever serialized)
+OR_NODE = {'text': 'OR'}
+
 def build_tree(no_of_states, initial_state, accepting_states):
   # build the tree structure that is later used to populate the tree view in the web app
+  # every step also carries its indices as 'kij', so neither the browser nor /swap have to parse them from the label
   n = no_of_states+1
   # title at the very top (also used to go back to a non-colored graph)
   tree_struct = [{'text': 'DFA Graph'}]
+  stack = []
   for i in range(1, n):
     for j in range(1, n):
       # populate top layer of the tree view 
@@ -42,58 +134,41 @@ def build_tree(no_of_states, initial_state, accepting_states):
         # if this is a step which makes up the resulting regex (k = states, i initial state, j in accepting states), make the text red
         node = {
                  'text': label,
+                 'kij': [n-1, i, j],
                  'backColor': '#bbbbbb',
                  'nodes': []
                }
       else:
         node = {
                  'text': label,
+                 'kij': [n-1, i, j],
                  'nodes': []
                }
       tree_struct.append(node)
-  # recursively go through all of the nodes in the top layer and edit the 'nodes' field with the next deeper layer (as long as k >= 0)
-  for e in tree_struct:
-    if e['text'] != 'DFA Graph':
-      append_tree_rec(e)
+      stack.append((node, n-1, i, j))
+  # go through all of the nodes that still need children and fill their 'nodes' field with the next deeper layer (as long as k >= 0)
+  # an explicit stack of (node, k, i, j) is used instead of recursion, so the indices never have to be parsed from the labels again
+  while stack:
+    (node, k, i, j) = stack.pop()
+    # children in the order they appear in a(k, i, j) = a(k-1, i, j) | a(k-1, i, k) a(k-1, k, k)* a(k-1, k, j)
+    steps = [(i, j, ''), (i, k, ''), (k, k, '*'), (k, j, '')]
+    if k == 1:
+      # special case, the labels for k = 0 are leaves of the tree, so they don't need the nodes list for children
+      children = [{'text': ints_to_tree_label(k-1, s, e) + suffix, 'kij': [k-1, s, e]} for (s, e, suffix) in steps]
+    else:
+      # add children and remember to fill each of them later on
+      children = [{'text': ints_to_tree_label(k-1, s, e) + suffix, 'kij': [k-1, s, e], 'nodes': []} for (s, e, suffix) in steps]
+      stack.extend((child, k-1, s, e) for (child, (s, e, suffix)) in zip(children, steps))
+    node['nodes'] = [children[0], OR_NODE] + children[1:]
   return tree_struct
-
-def append_tree_rec(node):
-  # extract indices from parent's label
-  (k, i, j) = tree_label_to_ints(node['text'])
-  if k == 0:
-    # base case, parent was already at the last step, nothing more to append
-    return
-  elif k == 1:
-    # special case, the labels for k = 0 are leaves of the tree, so they don't need the nodes list for children
-    node['nodes'].append({'text': ints_to_tree_label(k-1, i, j)})
-    node['nodes'].append({'text': 'OR'})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, i, k)})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, k, k) + '*'})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, k, j)})
-  else:
-    # recursive case, add children and recursively call function on each of them
-    node['nodes'].append({'text': ints_to_tree_label(k-1, i, j), 'nodes': []})
-    node['nodes'].append({'text': 'OR'})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, i, k), 'nodes': []})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, k, k) + '*', 'nodes': []})
-    node['nodes'].append({'text': ints_to_tree_label(k-1, k, j), 'nodes': []})
-    for e in node['nodes']:
-      if e['text'] != 'OR':
-        append_tree_rec(e)
       
 def ints_to_tree_label(k, i, j):
   # build a tree label in the form 'a(k, i, j)' from three indices k, i, j
-  return 'a(' + ', '.join([str(k), str(i), str(j)]) + ')'
+  return f'a({k}, {i}, {j})'
   
 def tree_label_to_ints(label):
-  # extract the three indices k, i, j from a tree label in the form 'a(k, i, j)'
-  trunc = label[2:-1]
-  # for labels ending in *, truncate one more char
-  if trunc[-1] == ')':
-    trunc = trunc[:-1]
-  trunc = trunc.replace(',', '')
-  trunc = trunc.split(' ')
-  return (int(trunc[0]), int(trunc[1]), int(trunc[2]))
+  # extract the three indices k, i, j from a tree label in the form 'a(k, i, j)' (labels may end in an additional *)
+  return tuple(map(int, TREE_LABEL.match(label).groups()))
            
 @app.route('/')
 def index():
@@ -116,98 +191,97 @@ def index():
 @app.route('/user/<id>', methods=['GET', 'POST'])  
 def user(id):
   dir = './' + UPLOAD_FOLDER + '/' + id + '/'
-  # backup of previously loaded to render in case new input has an error (this is always either already verified or the example automaton)
-  with open(dir + 'dfa_encoding.json', 'r') as fd:
-    json_backup = json.load(fd)
-  # build DFA from encoding, convert to regex and generate a visualization of the entire DFA
-  backup_dfa = dfa.DFA(json_backup['states'], json_backup['alphabet'], json_backup['initial'], json_backup['accept'], json_backup['transitions'])
-  (backup_total_regex, backup_regex_table, backup_step_table) = backup_dfa.to_regex()
-  backup_visualized = backup_dfa.visualize('backup_visualization')
-  backup_visualized_output = backup_visualized.pipe(format='png')
-  backup_visualized_output = base64.b64encode(backup_visualized_output).decode('utf-8')
-  backup_tree_data = build_tree(backup_dfa.states, backup_dfa.initial, backup_dfa.accept)
-  # backup the file itself too (could otherwise be overwritten if the error only occurs after saving)
-  shutil.copyfile(dir + 'dfa_encoding.json', dir + 'backup_dfa_encoding.json')
+  def render_error(error):
+    # render site with previously loaded DFA and an error, in case new input has one (previous one is always either already verified or the example automaton)
+    # only loaded when it is needed, so successful uploads never build it
+    backup_fingerprint = encoding_fingerprint(id)
+    backup = load_session(id, backup_fingerprint)
+    return render_template('application.html', error=error, id=id, regex=backup.total_regex, img=url_for('image', id=id, v=backup_fingerprint), tree_data=backup.tree_data)
   if request.method == 'POST':
     # if the request method was POST, a new file was uploaded and must be verified
     if 'file' not in request.files:
-      return render_template('application.html', error='No file uploaded!', id=id, regex=backup_total_regex, visualized_output=backup_visualized_output, tree_data=backup_tree_data)
+      return render_error('No file uploaded!')
     file = request.files['file']
     if file.filename == '':
-      return render_template('application.html', error='No file selected!', id=id, regex=backup_total_regex, visualized_output=backup_visualized_output, tree_data=backup_tree_data)
-    if file and allowed_file(file.filename):
-      file.save(dir + 'dfa_encoding.json')
-    else:
-      return render_template('application.html', error='That type of file is not allowed!', id=id, regex=backup_total_regex, visualized_output=backup_visualized_output, tree_data=backup_tree_data)
-  try:
-    with open(dir + 'dfa_encoding.json', 'r') as f:
-      json_data = json.load(f)
-    # build DFA from encoding, convert to regex and generate a visualization of the entire DFA
-    current_dfa = dfa.DFA(json_data['states'], json_data['alphabet'], json_data['initial'], json_data['accept'], json_data['transitions'])
-    (total_regex, regex_table, step_table) = current_dfa.to_regex()
-    visualized = current_dfa.visualize('current_visualization')
-    visualized_output = visualized.pipe(format='png')
-    visualized_output = base64.b64encode(visualized_output).decode('utf-8')
-    os.remove(dir + 'backup_dfa_encoding.json')
-    tree_data = build_tree(current_dfa.states, current_dfa.initial, current_dfa.accept)
-    # everything okay, delete backup file and render site with visualization of the entire DFA and regex
-    return render_template('application.html', id=id, regex=total_regex, visualized_output=visualized_output, tree_data=tree_data)
-  except json.JSONDecodeError:
-    # error while decoding, restore previously loaded from backup and render site with error
-    shutil.copyfile(dir + 'backup_dfa_encoding.json', dir + 'dfa_encoding.json')
-    return render_template('application.html', error='Invalid JSON file!', id=id, regex=backup_total_regex, visualized_output=backup_visualized_output, tree_data=backup_tree_data)
-  except Exception as e:
-    # json file does not comply with the necessary format, restore previously loaded from backup and render site with error
-    shutil.copyfile(dir + 'backup_dfa_encoding.json', dir + 'dfa_encoding.json')
-    return render_template('application.html', error=f'DFA not correctly encoded: {str(e)}', id=id, regex=backup_total_regex, visualized_output=backup_visualized_output, tree_data=backup_tree_data)
+      return render_error('No file selected!')
+    if not file or not allowed_file(file.filename):
+      return render_error('That type of file is not allowed!')
+    # the upload is read and parsed once and checked in memory, it only replaces the current encoding if it is valid (so there is nothing to restore on errors)
+    encoding = file.read()
+    try:
+      current = build_session(orjson.loads(encoding), render=True)
+    except orjson.JSONDecodeError:
+      # error while decoding
+      return render_error('Invalid JSON file!')
+    except Exception as e:
+      # json file does not comply with the necessary format
+      return render_error(f'DFA not correctly encoded: {str(e)}')
+    with open(dir + 'dfa_encoding.json', 'wb') as f:
+      f.write(encoding)
+    # the new session was already built above, cache it under the fingerprint of the file that was just written
+    fingerprint = encoding_fingerprint(id)
+    cache_session(id, fingerprint, current)
+  else:
+    fingerprint = encoding_fingerprint(id)
+    current = load_session(id, fingerprint, render=True)
+  # everything okay, render site with visualization of the entire DFA and regex
+  return render_template('application.html', id=id, regex=current.total_regex, img=url_for('image', id=id, v=fingerprint), tree_data=current.tree_data)
     
 @app.route('/swap', methods=['POST'])
 def swap():
   # route for async requests if something in the tree view was clicked
   data = request.get_json()
-  dir = './' + UPLOAD_FOLDER + '/' + data['id'] + '/'
+  # the browser requests the matching image from /img by itself (in parallel), so only the regex is returned here
   label = data['label']
-  with open(dir + 'dfa_encoding.json', 'r') as f:
-    json_data = json.load(f)
-  current_dfa = dfa.DFA(json_data['states'], json_data['alphabet'], json_data['initial'], json_data['accept'], json_data['transitions'])
-  (total_regex, regex_table, step_table) = current_dfa.to_regex()
+  current = load_session(data['id'], encoding_fingerprint(data['id']))
   if label == 'DFA Graph':
-    # base label was clicked - go back to graph for the entire DFA with no steps colored in
-    visualized = current_dfa.visualize('current_visualization')
-    visualized_output = visualized.pipe(format='png')
-    visualized_output = base64.b64encode(visualized_output).decode('utf-8')
+    # base label was clicked - go back to the regex for the entire DFA
     # case differentiation in case of empty set
-    regex_output = 'Ø' if isinstance(total_regex, int) else str(total_regex)
-    return {'regex': regex_output, 'img': visualized_output}
+    regex_output = 'Ø' if isinstance(current.total_regex, int) else str(current.total_regex)
   else: 
-    # a certain step was clicked, extract indices from label and generate image and regex corresponding to that step
-    (k, i, j) = tree_label_to_ints(label)
-    visualized = current_dfa.visualize('current_visualization', step_table[k][i][j], i, j)
-    visualized_output = visualized.pipe(format='png')
-    visualized_output = base64.b64encode(visualized_output).decode('utf-8')
+    # a certain step was clicked, take its indices (or extract them from the label, if the client didn't send them) and return regex corresponding to that step
+    (k, i, j) = data['kij'] if 'kij' in data else tree_label_to_ints(label)
     # case differentiation in case of empty set
-    regex_output = 'Ø' if isinstance(regex_table[k][i][j], int) else str(regex_table[k][i][j])
-    return {'regex': regex_output, 'img': visualized_output}
+    regex_output = 'Ø' if isinstance(current.regex_table[k][i][j], int) else str(current.regex_table[k][i][j])
+  return json_response({'regex': regex_output})
+    
+@app.route('/img/<id>')
+def image(id):
+  # route for the visualization of the entire DFA or (if k, i and j are given) the step a(k, i, j)
+  # the url also contains the fingerprint of the encoding (v), so a new upload leads to a new url and cached images are never stale
+  fingerprint = encoding_fingerprint(id)
+  (k, i, j) = (request.args.get('k', type=int), request.args.get('i', type=int), request.args.get('j', type=int))
+  etag = hashlib.blake2b(f'{fingerprint}:{k}:{i}:{j}'.encode('utf-8'), digest_size=16).hexdigest()
+  # browser already has this image, no need to render or send it again
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  else:
+    response = Response(render_image(id, fingerprint, k, i, j), mimetype='image/svg+xml')
+  response.set_etag(etag)
+  return response
+
+@app.after_request
+def cache_images(response):
+  # images are only ever requested through urls that change with the encoding, so the browser may keep them (but not errors, which could be gone on the next try)
+  if request.endpoint == 'image' and response.status_code in (200, 304):
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+  return response
     
 @app.route('/sanity', methods=['POST'])
 def sanity():
   # route for async requests to sanity check an input against both automaton and regex
   data = request.get_json()
-  dir = './' + UPLOAD_FOLDER + '/' + data['id'] + '/'
   to_check = data['input']
-  with open(dir + 'dfa_encoding.json', 'r') as f:
-    json_data = json.load(f)
-  current_dfa = dfa.DFA(json_data['states'], json_data['alphabet'], json_data['initial'], json_data['accept'], json_data['transitions'])
-  (total_regex, regex_table, step_table) = current_dfa.to_regex()
+  current = load_session(data['id'], encoding_fingerprint(data['id']))
   # check against automaton, throw error message if input does not match the automaton's alphabet
   try:
-    automaton_match = current_dfa.is_accepted(to_check)
+    automaton_match = current.dfa.is_accepted(to_check)
   except ValueError as e:
-    return {'message': str(e)}
-  regex_match = reg.fullmatch(str(total_regex), to_check)
+    return json_response({'message': str(e)})
+  regex_match = compiled_regex(str(current.total_regex)).fullmatch(to_check)
   automaton_result = '\'' + to_check + '\' ' + ('not ' if not automaton_match else '') + 'accepted by current DFA!'
   regex_result = '\'' + to_check + '\' ' + ('not ' if not automaton_match else '') + 'accepted by current RegEx!'
-  return {'message': automaton_result + '\n' + regex_result}
+  return json_response({'message': automaton_result + '\n' + regex_result})
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -1,6 +1,5 @@
 import graphviz as gv
 import regex as re
-import copy
 
 class DFA:
   
@@ -57,22 +56,22 @@ class DFA:
     # check input for given transition function
     if not isinstance(transitions, list):
       raise TypeError('Transitions table must be a dictionary in the format {"start": value, "input": value, "end": value!')
-    for i in transitions:
+    for idx, i in enumerate(transitions):
       if not isinstance(i['start'], int) or not isinstance(i['end'], int):
         raise TypeError('Start and end point of each transition must be an integer!')
       elif i['start'] < 1 or i['start'] > states:
-        err_msg = 'Start point of each transition must be a valid state (an integer between 1 and the number of states ' + str(states) + '), but the one at index ' + str(transitions.index(i)) + ' is ' + str(i['start']) + '!'
+        err_msg = 'Start point of each transition must be a valid state (an integer between 1 and the number of states ' + str(states) + '), but the one at index ' + str(idx) + ' is ' + str(i['start']) + '!'
         raise ValueError(err_msg)
       elif i['end'] < 1 or i['end'] > states:
-        err_msg = 'End point of each transition must be a valid state (an integer between 1 and the number of states ' + str(states) + '), but the one at index ' + str(transitions.index(i)) + ' is ' + str(i['end']) + '!'
+        err_msg = 'End point of each transition must be a valid state (an integer between 1 and the number of states ' + str(states) + '), but the one at index ' + str(idx) + ' is ' + str(i['end']) + '!'
         raise ValueError(err_msg)
       elif not isinstance(i['input'], str): 
         raise TypeError('Input for each transition must be a string!')
       elif len(i['input']) != 1:
-        err_msg = 'Input for each transition must be a single character, but found \'' + i['input'] + '\' at index ' + str(transitions.index(i)) + '!'
+        err_msg = 'Input for each transition must be a single character, but found \'' + i['input'] + '\' at index ' + str(idx) + '!'
         raise ValueError(err_msg)
       elif i['input'] not in alphabet:
-        err_msg = 'Input for each transition must be element of the given alphabet, but found \'' + i['input'] + '\' at index ' + str(transitions.index(i)) + '!'
+        err_msg = 'Input for each transition must be element of the given alphabet, but found \'' + i['input'] + '\' at index ' + str(idx) + '!'
         raise ValueError(err_msg)
       self.transitions[i['start']][i['input']] = i['end']
     
@@ -86,6 +85,10 @@ class DFA:
          err_msg = 'Given transition function is not defined for each possible input, δ(' + str(i) + ', \'' + str(j) + '\') is missing!'
          raise ValueError(err_msg)
          
+    # create a 2d transition table for running the automaton, delta[s][sigma[c]] is the state reached from s with input c
+    self.sigma = {c: idx for idx, c in enumerate(self.alphabet)}
+    self.delta = [None] + [[self.transitions[i][c] for c in self.alphabet] for i in range(1, states+1)]
+         
     # create a dictionary that associates each tuple (s1, s2) of two states with all inputs that lead to a transitions from s1 to s2
     self.edge_map = {(i, j): [] for i in range(1, self.states+1) for j in range(1, self.states+1)}
     for i in self.transitions:
@@ -109,39 +112,47 @@ class DFA:
     if len(self.accept) == self.states:
       return True
     current_state = self.initial 
-    for c in input:
-      try:
-        current_state = self.transitions[current_state][c]
-      except KeyError:
-        err_msg = 'Given input contains character \'' + c + '\' that is not part of this automaton\'s alphabet!'
-        raise ValueError(err_msg)
+    # local references and list indexing instead of the nested dictionary keep the loop over the input as short as possible
+    delta = self.delta
+    sigma = self.sigma
+    try:
+      for c in input:
+        current_state = delta[current_state][sigma[c]]
+    except KeyError:
+      err_msg = 'Given input contains character \'' + c + '\' that is not part of this automaton\'s alphabet!'
+      raise ValueError(err_msg)
     return current_state in self.accept
 
+  def edges_of(self, mask):
+    # convert a bitmask of transitions from the step table of to_regex back to a set of tuples (s1, s2), bit (s1-1)*states + (s2-1) stands for (s1, s2)
+    edges = set()
+    # only visit the bits that are actually set, by isolating and clearing the lowest one each iteration
+    while mask:
+      lowest = mask & -mask
+      b = lowest.bit_length() - 1
+      edges.add((b // self.states + 1, b % self.states + 1))
+      mask ^= lowest
+    return edges
+
   def visualize(self, file_name, colored_edges=None, step_start=-1, step_end=-1):
     # default colors and colors for start state, end state and involved transitions (if a step is visualized)
     bg_color = ['white' for i in range(0, self.states+1)]
-    transition_color = {(x, y): 'black' for x in range(1, self.states+1) for y in range(1, self.states+1)}
-    transition_width = {(x, y): '1.0' for x in range(1, self.states+1) for y in range(1, self.states+1)}
-    transition_style = {(x, y): 'solid' for x in range(1, self.states+1) for y in range(1, self.states+1)}
-    if colored_edges:
-      for e in colored_edges[0]:
-        transition_color[e] = 'blue'   
-        transition_width[e] = '3.0'
-        transition_style[e] = 'dashed'
-      for f in colored_edges[1]:
+    (left_edges, right_edges) = (self.edges_of(colored_edges[0]), self.edges_of(colored_edges[1])) if colored_edges else (set(), set())
+    def transition_style(edge):
+      # color, width and style of a transition, only computed for transitions that actually exist
+      if edge in right_edges:
         # used on both sides
-        if f in colored_edges[0]:
-          transition_color[f] = 'green'
-          transition_style[f] = 'solid'
-        else: 
-          transition_color[f] = 'red'
-          transition_style[f] = 'dashed'
-        transition_width[f] = '3.0'
+        if edge in left_edges:
+          return ('green', '3.0', 'solid')
+        return ('red', '3.0', 'dashed')
+      if edge in left_edges:
+        return ('blue', '3.0', 'dashed')
+      return ('black', '1.0', 'solid')
     if step_start >= 1 and step_end >= 1:
       # use a gradient if start and end state are equivalent, otherwise gray for start and yellow for end state
       (bg_color[step_start], bg_color[step_end]) = ('gray', 'yellow') if step_start != step_end else ('gray:yellow', 'gray:yellow')
-    # create new graph representation with graphviz
-    dot = gv.Digraph(name=file_name, format='png')
+    # create new graph representation with graphviz (rendered as svg, which is a lot faster to produce than png and scales in the browser)
+    dot = gv.Digraph(name=file_name, format='svg')
     # set layout direction (left to right)
     dot.graph_attr['rankdir'] = 'LR'
     dot.graph_attr['size'] = '16,8'
@@ -160,7 +171,8 @@ class DFA:
     for i in self.edge_map:
       if self.edge_map[i]: 
         # create a pretty label from the value list
-        dot.edge('z' + str(i[0]), 'z' + str(i[1]), label=', '.join(self.edge_map[i]), color=transition_color[i], fontcolor=transition_color[i], penwidth = transition_width[i], style=transition_style[i])
+        (color, width, style) = transition_style(i)
+        dot.edge('z' + str(i[0]), 'z' + str(i[1]), label=', '.join(self.edge_map[i]), color=color, fontcolor=color, penwidth = width, style=style)
     # render visualization
     return dot
     
@@ -171,29 +183,40 @@ class DFA:
     # create another matrix to store which transitions are relevant for each step (will be color-coded when the user chooses to look at this step)
     # t_table[k][i][j][0] contains transitions relevant for expression on the left side of alternation for this step
     # t_table[k][i][j][1] contains transitions relevant for expression on the right side of alternation for this step
-    t_table = [[[[set() for x in range(2)] for k in range(n)] for j in range(n)] for i in range(n)]
+    # both are bitmasks over all possible transitions (see edges_of), so merging the transitions of two steps is a single bitwise or
+    # each entry is an immutable pair that is only ever replaced, so all steps without any transitions can share the same one
+    no_transitions = (0, 0)
+    t_table = [[[no_transitions] * n for j in range(n)] for i in range(n)]
     # initialize values for k=0
     for i in range(1, n):
       for j in range (1, n):
         if i == j:
-          r_table[0][i][j] = re.Regex(re.NodeType.STRING, ['ε'])
+          r_table[0][i][j] = re.Regex(re.STRING, ['ε'])
         for a in self.alphabet:
           if a in self.edge_map[(i, j)]:
             # different construction for table entries with something in them and un-initialized ones
             if isinstance(r_table[0][i][j], int):
-              r_table[0][i][j] = re.Regex(re.NodeType.STRING, [a])
+              r_table[0][i][j] = re.Regex(re.STRING, [a])
             else:
-              r_table[0][i][j] = re.Regex(re.NodeType.ALTERNATION, [r_table[0][i][j], re.Regex(re.NodeType.STRING, [a])])
-            t_table[0][i][j][0].update([(i, j)])
+              r_table[0][i][j] = re.Regex(re.ALTERNATION, [r_table[0][i][j], re.Regex(re.STRING, [a])])
+            t_table[0][i][j] = (1 << ((i-1)*self.states + (j-1)), 0)
     # fill table for values of k = 1, ..., n
     for k in range (1, n):
+      # the previous layer of both tables is the same for every cell of this layer, so only look it up once
+      r_prev = r_table[k-1]
+      t_prev = t_table[k-1]
+      # every cell of this layer only needs the union of both sides of previous entries, so merge each of them only once
+      t_union = [[left_mask | right_mask for (left_mask, right_mask) in row] for row in t_prev]
+      # transitions of a(k-1, k, k) are part of the right side of every cell
+      t_loop = t_union[k][k]
+      # regex nodes are never changed once built, so entries of the previous layer (and the star in the middle, which is the same for every cell) can be shared instead of copied
+      middle = re.Regex(re.KLEENE_STAR, [r_prev[k][k]])
       for i in range (1, n):
+        # transitions of a(k-1, i, k) are part of the right side of every cell in this row
+        t_into = t_union[i][k] | t_loop
         for j in range (1, n):
-          left = copy.deepcopy(r_table[k-1][i][j])
-          right_elements = []
-          right_elements.append(copy.deepcopy(r_table[k-1][i][k]))
-          right_elements.append(re.Regex(re.NodeType.KLEENE_STAR, [copy.deepcopy(r_table[k-1][k][k])]))
-          right_elements.append(copy.deepcopy(r_table[k-1][k][j]))
+          left = r_prev[i][j]
+          right_elements = [r_prev[i][k], middle, r_prev[k][j]]
           # again, some table entries may be still be un-initialized
           right_is_empty = any(map(lambda x: isinstance(x, int), right_elements))
           '''
@@ -212,49 +235,37 @@ class DFA:
             r_table[k][i][j] = 0
           elif isinstance(left, int):
             # left side un-initialized, alternation disappears, while concatenation on right side remains
-            r_table[k][i][j] = re.Regex(re.NodeType.CONCATENATION, right_elements)
-            t_table[k][i][j][0].update(t_table[k-1][i][j][0])
-            t_table[k][i][j][0].update(t_table[k-1][i][j][1])
-            t_table[k][i][j][1].update(t_table[k-1][i][k][0])
-            t_table[k][i][j][1].update(t_table[k-1][i][k][1])
-            t_table[k][i][j][1].update(t_table[k-1][k][k][0])
-            t_table[k][i][j][1].update(t_table[k-1][k][k][1])
-            t_table[k][i][j][1].update(t_table[k-1][k][j][0])
-            t_table[k][i][j][1].update(t_table[k-1][k][j][1])
+            r_table[k][i][j] = re.Regex(re.CONCATENATION, right_elements)
+            t_table[k][i][j] = (t_union[i][j], t_into | t_union[k][j])
           elif right_is_empty:
             # same principle as above, but only the single term on the left side remains
             r_table[k][i][j] = left
-            t_table[k][i][j][0].update(t_table[k-1][i][j][0])
-            t_table[k][i][j][0].update(t_table[k-1][i][j][1])
+            t_table[k][i][j] = (t_union[i][j], 0)
+            # the entry is shared with the previous layer, which was already simplified (only the initial entries for k = 0 weren't)
+            if k > 1:
+              continue
           else:
             # everything initialized, we can proceed and check for equalities
-            if (k-1, i, j) == (k-1, i, k):
-              # indices equivalent to left == right_elements[0] (but without having to compare objects), apply rule I
-              r_table[k][i][j] = re.Regex(re.NodeType.CONCATENATION, [right_elements[0], re.Regex(re.NodeType.MAYBE, [re.Regex(re.NodeType.CONCATENATION, right_elements[1:])])])
-            elif (k-1, i, k) == (k-1, k, k) and (k-1, k, k) == (k-1, k, j):
+            if j == k:
+              # a(k-1, i, j) and a(k-1, i, k) are the same entry, so left == right_elements[0] (without having to compare objects), apply rule I
+              r_table[k][i][j] = re.Regex(re.CONCATENATION, [right_elements[0], re.Regex(re.MAYBE, [re.Regex(re.CONCATENATION, right_elements[1:])])])
+            elif i == k and j == k:
               # indices equivalent to "all values on the right side equal", apply rule II
-              right = re.Regex(re.NodeType.CONCATENATION, [right_elements[0], re.Regex(re.NodeType.KLEENE_PLUS, [right_elements[0]])])
-              r_table[k][i][j] = re.Regex(re.NodeType.ALTERNATION, [left, right])
-            elif (k-1, i, k) == (k-1, k, k):
+              right = re.Regex(re.CONCATENATION, [right_elements[0], re.Regex(re.KLEENE_PLUS, [right_elements[0]])])
+              r_table[k][i][j] = re.Regex(re.ALTERNATION, [left, right])
+            elif i == k:
               # indices equivalent to right_elements[0] == right_elements[1], apply rule III
-              right = re.Regex(re.NodeType.CONCATENATION, [re.Regex(re.NodeType.KLEENE_PLUS, [right_elements[0]]), right_elements[2]])
-              r_table[k][i][j] = re.Regex(re.NodeType.ALTERNATION, [left, right])
-            elif (k-1, k, k) == (k-1, k, j):
+              right = re.Regex(re.CONCATENATION, [re.Regex(re.KLEENE_PLUS, [right_elements[0]]), right_elements[2]])
+              r_table[k][i][j] = re.Regex(re.ALTERNATION, [left, right])
+            elif j == k:
               # indiced equivalent to right_elements[1] == right_elements[2], apply rule IV
-              right = re.Regex(re.NodeType.CONCATENATION, [right_elements[0], re.Regex(re.NodeType.KLEENE_PLUS, [right_elements[1]])])
-              r_table[k][i][j] = re.Regex(re.NodeType.ALTERNATION, [left, right])
+              right = re.Regex(re.CONCATENATION, [right_elements[0], re.Regex(re.KLEENE_PLUS, [right_elements[1]])])
+              r_table[k][i][j] = re.Regex(re.ALTERNATION, [left, right])
             else:
               # no equalities, build table entry as normal
-              right = re.Regex(re.NodeType.CONCATENATION, right_elements)
-              r_table[k][i][j] = re.Regex(re.NodeType.ALTERNATION, [left, right])
-            t_table[k][i][j][0].update(t_table[k-1][i][j][0])
-            t_table[k][i][j][0].update(t_table[k-1][i][j][1])
-            t_table[k][i][j][1].update(t_table[k-1][i][k][0])
-            t_table[k][i][j][1].update(t_table[k-1][i][k][1])
-            t_table[k][i][j][1].update(t_table[k-1][k][k][0])
-            t_table[k][i][j][1].update(t_table[k-1][k][k][1])
-            t_table[k][i][j][1].update(t_table[k-1][k][j][0])
-            t_table[k][i][j][1].update(t_table[k-1][k][j][1])
+              right = re.Regex(re.CONCATENATION, right_elements)
+              r_table[k][i][j] = re.Regex(re.ALTERNATION, [left, right])
+            t_table[k][i][j] = (t_union[i][j], t_into | t_union[k][j])
           # simplify the resulting regex further
           if not isinstance(r_table[k][i][j], int):
             r_table[k][i][j] = re.simplify_regex(r_table[k][i][j])
@@ -269,4 +280,4 @@ class DFA:
       return (candidates[0], r_table, t_table)
     else:
       # construct alternation and return that
-      return (re.Regex(re.NodeType.ALTERNATION, candidates), r_table, t_table)
\ No newline at end of file
+      return (re.Regex(re.ALTERNATION, candidates), r_table, t_table)
\ No newline at end of file
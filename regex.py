@@ -1,14 +1,22 @@
-from enum import Enum
-import copy
+from functools import lru_cache
+from threading import Lock
+from weakref import WeakValueDictionary
 
 
-class NodeType(Enum):
-  STRING = 0
-  ALTERNATION = 1
-  CONCATENATION = 2
-  KLEENE_STAR = 3
-  KLEENE_PLUS = 4
-  MAYBE = 5
+# types of regex nodes, plain integers so comparing them (and using them as index) is cheap
+STRING = 0
+ALTERNATION = 1
+CONCATENATION = 2
+KLEENE_STAR = 3
+KLEENE_PLUS = 4
+MAYBE = 5
+# sets of types as bitmasks, so checking whether a node has one of them is a single bitwise and (e.g. (1 << x.type) & WRAPPING)
+# types that wrap a single child, i.e. Kleene Star, Plus and Maybe
+WRAPPING = (1 << KLEENE_STAR) | (1 << KLEENE_PLUS) | (1 << MAYBE)
+# types that also match the empty word, i.e. Kleene Star and Maybe
+STAR_OR_MAYBE = (1 << KLEENE_STAR) | (1 << MAYBE)
+# names of the types (for debugging output)
+TYPE_NAMES = ['STRING', 'ALTERNATION', 'CONCATENATION', 'KLEENE_STAR', 'KLEENE_PLUS', 'MAYBE']
   
   
 class Regex:
@@ -16,278 +24,290 @@ class Regex:
   JOINED_BY = ['', '|', '', '', '', '']
   IN_PARENTHESES = [False, True, True, False, False, False]
   SUFFIX = ['', '', '', '*', '+', '?']
+  # fixed set of attributes instead of a dict per node (there are a lot of them), __weakref__ is needed for the universe
+  __slots__ = ('type', 'values', 'string', 'simplified', '__weakref__')
+  # every node that currently exists, by type and children (see __new__)
+  universe = WeakValueDictionary()
+  universe_lock = Lock()
   
-  def __init__(self, type, values): 
-    self.type = type
-    self.values = values
+  def __new__(cls, type, values):
+    # nodes are never changed after construction (simplification builds new ones), so structurally equal nodes can be one and the same object
+    # children are unique themselves, so their ids identify them (and stay valid as long as the node referencing them exists)
+    # (only strings contain a plain value instead of other nodes, so the ids can be collected by the builtin map instead of checking each child)
+    values = tuple(values)
+    key = (type, values) if type == STRING else (type, tuple(map(id, values)))
+    # the lock makes sure that two threads building the same node at once still end up with the same object
+    with Regex.universe_lock:
+      node = Regex.universe.get(key)
+      if node is None:
+        node = super().__new__(cls)
+        node.type = type
+        node.values = values
+        # string representation, only built once it is needed (see __str__)
+        node.string = None
+        # whether no simplification step can change this node anymore (strings can't be simplified at all)
+        node.simplified = type == STRING
+        Regex.universe[key] = node
+    return node
     
-  def __eq__(self, other):
-    # base case
-    if self.type == NodeType.STRING and other.type == NodeType.STRING:
-      return self.values[0] == other.values[0]
-    # check for the most simple to recognize unequality, a different type or amount of child elements
-    if len(self.values) != len(other.values) or self.type != other.type:
-      return False
-    # check each child element for equality (recursively, but the construction should guarantee no cycles)
-    for i in range(len(self.values)):
-      if self.values[i] != other.values[i]:
-        return False
-    return True
+  # every regex exists only once, so equality and hashing only depend on the identity of a node
+  __eq__ = object.__eq__
+  __hash__ = object.__hash__
     
   def __str__(self):
+    # nodes never change, so their string representation only has to be built once (children are shared, so this also saves work for other nodes)
+    if self.string is None:
+      self.string = self.build_string()
+    return self.string
+    
+  def build_string(self):
     str_values = [str(i) for i in self.values]
     # check if parentheses are needed
-    if len(self.values) > 1 and Regex.IN_PARENTHESES[self.type.value]:
-      match self.type:
-        case NodeType.ALTERNATION:
-          return '(' + Regex.JOINED_BY[self.type.value].join(str_values) + Regex.SUFFIX[self.type.value] + ')'
-        case NodeType.CONCATENATION:
-          # concatenations that only have strings as child elements don't need parentheses
-          if all(map(lambda x: x.type == NodeType.STRING, self.values)):
-            return Regex.JOINED_BY[self.type.value].join(str_values) + Regex.SUFFIX[self.type.value]
-          else:
-            return '(' + Regex.JOINED_BY[self.type.value].join(str_values) + Regex.SUFFIX[self.type.value] + ')' 
-    return Regex.JOINED_BY[self.type.value].join(str_values) + Regex.SUFFIX[self.type.value]
-    
-  def __hash__(self):
-    if self.type == NodeType.STRING:
-      return hash(self.values[0])
-    return hash(repr(self))
+    if len(self.values) > 1 and Regex.IN_PARENTHESES[self.type]:
+      if self.type == ALTERNATION:
+        return '(' + Regex.JOINED_BY[self.type].join(str_values) + Regex.SUFFIX[self.type] + ')'
+      elif self.type == CONCATENATION:
+        # concatenations that only have strings as child elements don't need parentheses
+        if all(map(lambda x: x.type == STRING, self.values)):
+          return Regex.JOINED_BY[self.type].join(str_values) + Regex.SUFFIX[self.type]
+        else:
+          return '(' + Regex.JOINED_BY[self.type].join(str_values) + Regex.SUFFIX[self.type] + ')' 
+    return Regex.JOINED_BY[self.type].join(str_values) + Regex.SUFFIX[self.type]
+
 
+# results of simplify_step during a single call of simplify_regex, the same subexpression often appears more than once in a regex
+step_cache = {}
 
+
+# equal regexes are the same node and simplify to the same result, many subexpressions recur across the entries of a conversion table and between conversions
+# (results themselves don't need an entry, simplify_step returns them right away since they are marked as simplified)
+@lru_cache(maxsize=1024)
 def simplify_regex(r):
   # execute simplification steps until no further simplification is possible (returned regex is equal to initial regex)
-  before = copy.deepcopy(r)
-  r = simplify_step(r)
-  while before != r:
-    before = copy.deepcopy(r)
-    r = simplify_step(r)
+  # simplify_step returns its input itself if nothing changed, so comparing identities is enough
+  while (simplified := simplify_step(r)) is not r:
+    r = simplified
+  step_cache.clear()
   return r
   
   
 def simplify_step(r):
 
-  # return simple string values (no further simplification possible)
-  if r.type == NodeType.STRING:
+  # return simple string values and nodes that are already fully simplified (no further simplification possible)
+  if r.simplified:
     return r
-  # simplify all children recursively (recursion base case is a child with type STRING)
-  r.values = list(map(simplify_step, r.values))
-      
-  # apply some simplification rules according to the type of this node
-  match r.type:
-    
-    case NodeType.ALTERNATION:
-      # Rule: Alternation with a single option is no alternation at all
-      if len(r.values) == 1:
-        return r.values[0]
-      # RULE: x|x = x, we achieve this by converting the list to a dict (no duplicates) and back again (lower time complexity than manually iterating in 0(n^2))
-      r.values = list(dict.fromkeys(r.values))
-      # RULE: x|x* = x*, x|x+ = x+, x|x? = x?
-      # generate list of all elements that aren't Kleene Star, Plus or a Maybe
-      non_wrapping = [x for x in r.values if x.type in [NodeType.STRING, NodeType.ALTERNATION, NodeType.CONCATENATION]]         
-      # generate list of the content of all elements that are the above things
-      wrapping = [x.values[0] for x in r.values if x.type in [NodeType.KLEENE_PLUS, NodeType.KLEENE_STAR, NodeType.MAYBE]]     
-      # check if any of the elements in the first list are contained in any element in the second list, if so remove them
-      for e in non_wrapping:
-        if e in wrapping:
-          r.values.remove(e)
-      # RULE: ε|x = x?, achieved by checking if any child element is a string element containing 'ε'
-      try:
-        ep_index = list(map(lambda x: x.type == NodeType.STRING and x.values[0] == 'ε', r.values)).index(True)
-      except ValueError:
-        ep_index = -1
-      if ep_index >= 0 and len(r.values) > 1:
-        # remove the ε element, this expression becomes a Maybe with an alternation expression containing the other elements as a child       
-        r.values.pop(ep_index)
-        r.type = NodeType.MAYBE
-        new_alt = Regex(NodeType.ALTERNATION, r.values)
-        r.values = [new_alt]
-      # RULE: x?|y = (x|y)?, same procedure as above
-      try:
-        maybe_index = list(map(lambda x: x.type == NodeType.MAYBE, r.values)).index(True)
-      except ValueError:
-        maybe_index = -1
-      if maybe_index >= 0 and len(r.values) > 1:
-        # merge whatever the maybe element contains up one layer 
-        maybe_element = r.values[maybe_index]
-        maybe_element.type = maybe_element.values[0].type
-        maybe_element.values = maybe_element.values[0].values
-        # this expression becomes a Maybe with an alternation expression containing the other elements as a child       
-        r.type = NodeType.MAYBE
-        new_alt = Regex(NodeType.ALTERNATION, r.values)
-        r.values = [new_alt]
-      # Important: Check if any of these manipulations reduced everything to a single element (in that case: merge)
-      if len(r.values) == 1 and r.values[0].type == NodeType.STRING:
-        r.type = NodeType.STRING        
-        r.values = [r.values[0].values[0]]
-      # check type again because the ε|x = x? rule could have changed it
-      elif len(r.values) == 1 and r.type == NodeType.ALTERNATION:
-        r.type = r.values[0].type
-        r.values = r.values[0].values
-        
-    case NodeType.CONCATENATION:
-      # RULE: Concatenation with a single option is no concatenation at all
-      if len(r.values) == 1:
-        return r.values[0]
-      # RULE: xx* = x+ = x*x, we achieve this via pairwise iteration and comparison (via __eq__ implementation to catch deeper equalities)
-      # iterate from right to left, so something like xx*x becomes xx+ instead of x+x (leaves more room for other rules to simplify further)
-      i = len(r.values)-1
-      while i > 0:
-        left = r.values[i-1]
-        right = r.values[i]
-        # case xx*
-        if right.type == NodeType.KLEENE_STAR and left == right.values[0]:
-          r.values.pop(i-1)
-          right.type = NodeType.KLEENE_PLUS
-          i -= 1
-          continue
-        # case x*x
-        if left.type == NodeType.KLEENE_STAR and right == left.values[0]:
-          r.values.pop(i)
-          left.type = NodeType.KLEENE_PLUS
-          i -= 1
-          continue
-        i -= 1
-      # RULE: x?x* = x* = x*x?, again achieved via pairwise iteration
-      i = 0
-      max_index = len(r.values)-1
-      while i < max_index:
-        left = r.values[i]
-        right = r.values[i+1]
-        # case x?x*
-        if left.type == NodeType.MAYBE and right.type == NodeType.KLEENE_STAR and left.values[0] == right.values[0]:
-          r.values.pop(i)
-          max_index -= 1
-          continue
-        # case x*x?
-        if left.type == NodeType.KLEENE_STAR and right.type == NodeType.MAYBE and left.values[0] == right.values[0]:
-          r.values.pop(i+1)
-          max_index -= 1
-          continue
-        i+= 1
-      # RULE: Multiple ε are equal to a single ε (e.g. εεε = ε), we iterate and upon finding an ε we stop to 'eat' all immediately following ones to achieve this
-      # RULE: x*x* = x*, achieved via the same means as the rule above
-      i = 0
-      max_index = len(r.values)-1
-      while i < max_index:
-        left = r.values[i]
-        right = r.values[i+1]
-        epsilon_case = (left.type == NodeType.STRING and right.type == NodeType.STRING and left.values[0] == 'ε' and right.values[0] == 'ε')
-        kleene_case = (left.type == NodeType.KLEENE_STAR and right.type == NodeType.KLEENE_STAR and left.values[0] == right.values[0])
-        if epsilon_case or kleene_case:
-          r.values.pop(i+1)
-          max_index -= 1
-          continue
-        i += 1
-      # RULE: xε = x = εx, again achieved via pairwise iteration and checking if one of the two elements is an empty word
-      i = 0
-      max_index = len(r.values)-1
-      while i < max_index:
-        left = r.values[i]
-        right = r.values[i+1]
-        # case εx
-        if left.type == NodeType.STRING and left.values[0] == 'ε':
-          r.values.pop(i)
-          max_index -= 1
-          continue
-        # case xε
-        if right.type == NodeType.STRING and right.values[0] == 'ε':
-          r.values.pop(i+1)
-          max_index -= 1
-          continue
-        i += 1 
-      # Rule: x(y|z) = xy|xz and (x|y)z = xz|yz, again achieved via pairwise iteration, checking and concatenation of fitting elements
-      i = 0
-      max_index = len(r.values)-1
-      while i < max_index:
-        left = r.values[i]
-        right = r.values[i+1]
-        # case x(y|z) (simplification is not sensible if the single element is a Kleene Star, Plus or a Maybe)
-        if right.type == NodeType.ALTERNATION and left.type != NodeType.KLEENE_PLUS and left.type != NodeType.KLEENE_STAR and left.type != NodeType.MAYBE:
-          # replace old left element with new alternation, filled with pairwise concatenations of left element and right's values
-          new_alt = Regex(NodeType.ALTERNATION, [])
-          for e in right.values:
-            new_alt.values.append(Regex(NodeType.CONCATENATION, [left, e]))
-          # insert new alternation at old position of left element, delete right element
-          r.values = r.values[:i] + [new_alt] + r.values[i+2:]
-          max_index -= 1
-          continue
-        # case (x|y)z, same principle
-        if left.type == NodeType.ALTERNATION and right.type != NodeType.KLEENE_PLUS and right.type != NodeType.KLEENE_STAR and right.type != NodeType.MAYBE:
-          new_alt = Regex(NodeType.ALTERNATION, [])
-          for e in left.values:
-            new_alt.values.append(Regex(NodeType.CONCATENATION, [e, right]))
-          r.values = r.values[:i] + [new_alt] + r.values[i+2:]
-          max_index -= 1
-          continue
-        i += 1
-      # Important: Check if any of these manipulations reduced everything to a single element (in that case: merge)
-      if len(r.values) == 1 and r.values[0].type == NodeType.STRING:
-        r.type = NodeType.STRING        
-        r.values = [r.values[0].values[0]]
-      elif len(r.values) == 1:
-        r.type = r.values[0].type
-        r.values = r.values[0].values
-        
-    case NodeType.KLEENE_STAR:
-      # RULE: ε* = ε, we can just check if the child is a single node of type String with value 'ε' for this
-      if len(r.values) == 1 and r.values[0].type == NodeType.STRING and r.values[0].values[0] == 'ε':
-        # change type to string and make the value a list with one string (instead of another regex object)
-        r.type = NodeType.STRING
-        r.values = [r.values[0].values[0]]
-      # RULE: (ε|x|y)* = (x|y)*, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type == NodeType.ALTERNATION:
-        # check if any of the elements of that alternation is an ε
-        try:
-          ep_index = list(map(lambda x: x.type == NodeType.STRING and x.values[0] == 'ε', r.values[0].values)).index(True)
-        except ValueError:
-          ep_index = -1
-        if ep_index >= 0 and len(r.values[0].values) > 1:
-          r.values[0].values.pop(ep_index)
-      # RULE: (x*)* = (x+)* = (x?)* = x*, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type in [NodeType.KLEENE_STAR, NodeType.KLEENE_PLUS, NodeType.MAYBE]:
-        r.values = r.values[0].values
-        
-    case NodeType.KLEENE_PLUS:
-      # RULE: ε+ = ε, we can just check if the child is a single node of type String with value 'ε' for this
-      if len(r.values) == 1 and r.values[0].type == NodeType.STRING and r.values[0].values[0] == 'ε':
-        # change type to string and make the value a list with one string (instead of another regex object)
-        r.type = NodeType.STRING
-        r.values = [r.values[0].values[0]]
-      # RULE: (x*)+ = (x?)+ = x*, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type in [NodeType.KLEENE_STAR, NodeType.MAYBE]:
-        r.type = NodeType.KLEENE_STAR
-        r.values = r.values[0].values
-      # RULE: (x+)+ = x+, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type == NodeType.KLEENE_PLUS:
-        r.values = r.values[0].values
-        
-    case NodeType.MAYBE:
-      # RULE: ε? = ε, we can just check if the child is a single node of type String with value 'ε' for this
-      if len(r.values) == 1 and r.values[0].type == NodeType.STRING and r.values[0].values[0] == 'ε':
-        # change type to string and make the value a list with one string (instead of another regex object)
-        r.type = NodeType.STRING
-        r.values = [r.values[0].values[0]]
-      # RULE: (x*)? = x*, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type == NodeType.KLEENE_STAR:
-        r.type = NodeType.KLEENE_STAR
-        r.values = r.values[0].values
-      # RULE: (x?)? = x?, we need to check two layers deep for this
-      if len(r.values) == 1 and not isinstance(r.values[0], str) and r.values[0].type == NodeType.MAYBE:
-        r.values = r.values[0].values
-        
+  # simplify all children before their parent, walking the tree with a stack instead of recursion (so deep regexes can't exceed the recursion limit)
+  # each stack entry is a node and whether its children were already pushed, the results of this step are collected by node
+  results = {}
+  stack = [(r, False)]
+  while stack:
+    (node, expanded) = stack.pop()
+    if node in results:
+      continue
+    if expanded:
+      # all children are done now (fully simplified ones were skipped and stay as they are)
+      # the rules for each type work on a copy of the list of children and build new nodes instead of changing existing ones
+      # apply some simplification rules according to the type of this node (see STEP_BY_TYPE)
+      results[node] = step_cache[node] = STEP_BY_TYPE[node.type](node, [results.get(x, x) for x in node.values])
+      continue
+    # a step always produces the same result for the same node (which only exists once), so look up whether it was done before
+    cached = step_cache.get(node)
+    if cached is not None:
+      results[node] = cached
+      continue
+    stack.append((node, True))
+    stack.extend((x, False) for x in node.values if not x.simplified)
+  return results[r]
+  
+def simplify_string(r, values):
+  # strings are already as simple as possible
+  return r
+  
+def simplify_alternation(r, values):
+  type = r.type
+  # Rule: Alternation with a single option is no alternation at all
+  if len(values) == 1:
+    return values[0]
+  # RULE: x|x = x, we achieve this by converting the list to a dict (no duplicates) and back again (lower time complexity than manually iterating in 0(n^2))
+  # equal regexes are the same object and hashed by identity, so this neither has to look into nor compare any subtrees
+  values = list(dict.fromkeys(values))
+  # alternation is commutative, so bring the options into a canonical order (equal alternations then become the same node, no matter how they were built)
+  # sorted by their string representation, which is cached and, unlike the identity based hash, the same in every run
+  values.sort(key=str)
+  # RULE: x|x* = x*, x|x+ = x+, x|x? = x?
+  # generate set of the content of all elements that are Kleene Star, Plus or a Maybe
+  wrapped = {x.values[0] for x in values if (1 << x.type) & WRAPPING}
+  # keep all other elements only if they aren't contained in any of those (a single pass, since there are no duplicates left)
+  if wrapped:
+    values = [x for x in values if x not in wrapped or (1 << x.type) & WRAPPING]
+  # RULE: ε|x = x?, achieved by checking if any child element is a string element containing 'ε'
+  # (stops at the first match, -1 if there is none)
+  ep_index = next((i for (i, x) in enumerate(values) if x.type == STRING and x.values[0] == 'ε'), -1)
+  if ep_index >= 0 and len(values) > 1:
+    # remove the ε element, this expression becomes a Maybe with an alternation expression containing the other elements as a child       
+    values.pop(ep_index)
+    type = MAYBE
+    values = [Regex(ALTERNATION, values)]
+  # RULE: x?|y = (x|y)?, same procedure as above
+  maybe_index = next((i for (i, x) in enumerate(values) if x.type == MAYBE), -1)
+  if maybe_index >= 0 and len(values) > 1:
+    # replace the maybe element with whatever it contains (merge it up one layer)
+    values[maybe_index] = values[maybe_index].values[0]
+    # this expression becomes a Maybe with an alternation expression containing the other elements as a child       
+    type = MAYBE
+    values = [Regex(ALTERNATION, values)]
+  # Important: Check if any of these manipulations reduced everything to a single element (in that case: merge)
+  if len(values) == 1 and values[0].type == STRING:
+    type = STRING        
+    values = [values[0].values[0]]
+  # check type again because the ε|x = x? rule could have changed it
+  elif len(values) == 1 and type == ALTERNATION:
+    type = values[0].type
+    values = list(values[0].values)
+  return build_simplified(r, type, values)
+  
+def simplify_concatenation(r, values):
+  type = r.type
+  # RULE: Concatenation with a single option is no concatenation at all
+  if len(values) == 1:
+    return values[0]
+  # all rules below only look at two neighbouring elements, so they are applied in a single pass over all elements:
+  # each element is compared to the last one that was kept, and whenever a rule merges or removes them, the result is compared to the one before that
+  # iterate from right to left, so something like xx*x becomes xx+ instead of x+x (leaves more room for other rules to simplify further)
+  # kept therefore holds the elements to the right of the current one, the nearest one last
+  # (rules apply as soon as their pair of elements comes up, instead of one rule after the other over all elements, so some concatenations end up in a different but equivalent form than that would give)
+  kept = []
+  for left in reversed(values):
+    while kept:
+      right = kept[-1]
+      # RULE: xx* = x+ = x*x (via __eq__ implementation to catch deeper equalities)
+      if right.type == KLEENE_STAR and left == right.values[0]:
+        kept.pop()
+        left = Regex(KLEENE_PLUS, right.values)
+        continue
+      if left.type == KLEENE_STAR and right == left.values[0]:
+        kept.pop()
+        left = Regex(KLEENE_PLUS, left.values)
+        continue
+      # RULE: x?x* = x* = x*x?
+      if left.type == MAYBE and right.type == KLEENE_STAR and left.values[0] == right.values[0]:
+        left = kept.pop()
+        continue
+      if left.type == KLEENE_STAR and right.type == MAYBE and left.values[0] == right.values[0]:
+        kept.pop()
+        continue
+      # RULE: x*x* = x*
+      if left.type == KLEENE_STAR and right.type == KLEENE_STAR and left.values[0] == right.values[0]:
+        left = kept.pop()
+        continue
+      # RULE: xε = x = εx (which also turns multiple ε into a single one, e.g. εεε = ε)
+      if left.type == STRING and left.values[0] == 'ε':
+        left = kept.pop()
+        continue
+      if right.type == STRING and right.values[0] == 'ε':
+        kept.pop()
+        continue
+      # Rule: x(y|z) = xy|xz and (x|y)z = xz|yz (not sensible if the single element is a Kleene Star, Plus or a Maybe)
+      if right.type == ALTERNATION and not (1 << left.type) & WRAPPING:
+        # new alternation, filled with pairwise concatenations of left element and right's values, replaces both elements
+        kept.pop()
+        left = Regex(ALTERNATION, [Regex(CONCATENATION, [left, e]) for e in right.values])
+        continue
+      if left.type == ALTERNATION and not (1 << right.type) & WRAPPING:
+        kept.pop()
+        left = Regex(ALTERNATION, [Regex(CONCATENATION, [e, right]) for e in left.values])
+        continue
+      break
+    kept.append(left)
+  # back into the original order
+  kept.reverse()
+  values = kept
+  # Important: Check if any of these manipulations reduced everything to a single element (in that case: merge)
+  if len(values) == 1 and values[0].type == STRING:
+    type = STRING        
+    values = [values[0].values[0]]
+  elif len(values) == 1:
+    type = values[0].type
+    values = list(values[0].values)
+  return build_simplified(r, type, values)
+  
+def simplify_kleene_star(r, values):
+  type = r.type
+  # RULE: ε* = ε, we can just check if the child is a single node of type String with value 'ε' for this
+  if len(values) == 1 and values[0].type == STRING and values[0].values[0] == 'ε':
+    # change type to string and make the value a list with one string (instead of another regex object)
+    type = STRING
+    values = [values[0].values[0]]
+  # RULE: (ε|x|y)* = (x|y)*, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and values[0].type == ALTERNATION:
+    # check if any of the elements of that alternation is an ε
+    ep_index = next((i for (i, x) in enumerate(values[0].values) if x.type == STRING and x.values[0] == 'ε'), -1)
+    if ep_index >= 0 and len(values[0].values) > 1:
+      values[0] = Regex(ALTERNATION, values[0].values[:ep_index] + values[0].values[ep_index+1:])
+  # RULE: (x*)* = (x+)* = (x?)* = x*, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and (1 << values[0].type) & WRAPPING:
+    values = list(values[0].values)
+  return build_simplified(r, type, values)
+  
+def simplify_kleene_plus(r, values):
+  type = r.type
+  # RULE: ε+ = ε, we can just check if the child is a single node of type String with value 'ε' for this
+  if len(values) == 1 and values[0].type == STRING and values[0].values[0] == 'ε':
+    # change type to string and make the value a list with one string (instead of another regex object)
+    type = STRING
+    values = [values[0].values[0]]
+  # RULE: (x*)+ = (x?)+ = x*, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and (1 << values[0].type) & STAR_OR_MAYBE:
+    type = KLEENE_STAR
+    values = list(values[0].values)
+  # RULE: (x+)+ = x+, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and values[0].type == KLEENE_PLUS:
+    values = list(values[0].values)
+  return build_simplified(r, type, values)
+  
+def simplify_maybe(r, values):
+  type = r.type
+  # RULE: ε? = ε, we can just check if the child is a single node of type String with value 'ε' for this
+  if len(values) == 1 and values[0].type == STRING and values[0].values[0] == 'ε':
+    # change type to string and make the value a list with one string (instead of another regex object)
+    type = STRING
+    values = [values[0].values[0]]
+  # RULE: (x*)? = x*, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and values[0].type == KLEENE_STAR:
+    type = KLEENE_STAR
+    values = list(values[0].values)
+  # RULE: (x?)? = x?, we need to check two layers deep for this
+  if len(values) == 1 and not isinstance(values[0], str) and values[0].type == MAYBE:
+    values = list(values[0].values)
+  return build_simplified(r, type, values)
+  
+def build_simplified(r, type, values):
+  # build the result of a simplification step of r from the type and children its rules produced
   # merge children of the same type into the parent (only for alternations and concatenations!)      
-  if r.type != NodeType.STRING:
-    for i in range(len(r.values)):
-      if r.values[i].type == r.type and not Regex.SUFFIX[r.type.value]:
-        r.values = r.values[:i] + r.values[i].values + r.values[i+1:]
+  # a single pass that collects the children of the new node (the indices of a list that grows while iterating over it would miss some of them)
+  if (type == ALTERNATION or type == CONCATENATION) and any(x.type == type for x in values):
+    merged = []
+    for x in values:
+      if x.type == type:
+        merged.extend(x.values)
+      else:
+        merged.append(x)
+    values = merged
       
-  return r
+  # no rule applied (here or further down), so return the node itself instead of looking it up again
+  if type == r.type and len(values) == len(r.values) and all(x is y for (x, y) in zip(values, r.values)):
+    # the same holds for every later step, so the entire subtree never has to be looked at again
+    r.simplified = True
+    return r
+  return Regex(type, values)
+  
+# simplification step for each type of node, indexed by type
+STEP_BY_TYPE = [simplify_string, simplify_alternation, simplify_concatenation, simplify_kleene_star, simplify_kleene_plus, simplify_maybe]
   
 def print_tree(regex, indent=0):
-  if regex.type == NodeType.STRING:
+  if regex.type == STRING:
     print(' ' * indent, regex.values[0])
   else:
-    print(' ' * indent, regex.type.name)
+    print(' ' * indent, TYPE_NAMES[regex.type])
     for e in regex.values:
       print_tree(e, indent+2)